@@ -0,0 +1,95 @@
+"""
+a minimal benchmarking toolkit, shared by the *_bench.py scripts
+
+each measurement is a dict that describes what was measured
+(e.g. the function name and the input size) together with
+its 'seconds' and 'peak_bytes' fields; a run is saved as a JSON file,
+so that runs made before and after a change can be compared
+"""
+
+import gc
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+# the fields that hold a measurement, all the other ones
+# are used to match measurements from 2 different runs
+MEASURES = ('seconds', 'peak_bytes', 'speedup')
+
+
+def measure(function, *args, repeat=3, **kwargs):
+    """
+    time a function call, and measure its peak memory usage
+
+    Parameters:
+      function: the function to call with *args and **kwargs;
+        to measure a generator, pass a function that consumes it
+      repeat: the number of timed calls
+    Returns:
+      a tuple (measures, result) where measures is a dict with
+      * seconds: the best wall-clock time over the repeated calls
+      * peak_bytes: the peak memory allocated during one call
+      and result is what the last call returned
+    """
+    best = math.inf
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    # tracemalloc slows things down a lot,
+    # so memory is measured in a separate call
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': best, 'peak_bytes': peak}, result
+
+
+def save_results(filename, name, records):
+    """
+    store a list of measurements in a JSON file,
+    together with a description of the environment
+    """
+    output = {
+        'benchmark': name,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'results': records,
+    }
+    with open(filename, 'w') as writer:
+        json.dump(output, writer, indent=2)
+
+
+def _key(record):
+    return tuple(sorted((k, v) for k, v in record.items()
+                        if k not in MEASURES))
+
+
+def compare_results(filename, records):
+    """
+    print the ratio between the measurements in records
+    and the matching ones in a previous run stored in filename
+
+    a ratio above 1 means the new run is slower (or bigger)
+    """
+    with open(filename) as feed:
+        previous = {_key(record): record
+                    for record in json.load(feed)['results']}
+    for record in records:
+        old = previous.get(_key(record))
+        if old is None:
+            continue
+        ratios = ' '.join(
+            f"{field}={record[field] / old[field]:.2f}"
+            for field in MEASURES if old.get(field) and field in record)
+        label = ' '.join(f"{v}" for k, v in _key(record))
+        print(f"{label:60} {ratios}")
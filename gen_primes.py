@@ -1,13 +1,620 @@
 from nbautoeval import ExerciseGenerator, GeneratorArgs, PPrintRenderer
 
 
+# the sieve of Eratosthenes is much faster than trial division,
+# but it needs an upper bound; so to produce an endless stream we
+# sieve consecutive segments of integers, using as divisors the primes
+# up to the square root of the segment end (the so-called base primes)
+#
+# a segment only deals with odd numbers, and its booleans are
+# stored as a numpy array, sized to fit in a typical L2 cache
+from math import isqrt, log
+import numpy as np
+
+# the number of odd integers in a segment
+SEGMENT_SIZE = 1 << 18
+
+
+def _small_primes(limit):
+    """
+    all the primes <= limit, as a numpy array,
+    with a simple - i.e. not segmented - sieve
+    """
+    if limit < 2:
+        return np.empty(0, dtype=np.int64)
+    # sieve[i] is about the odd integer 2*i+1
+    sieve = np.ones((limit + 1) // 2, dtype=bool)
+    # 1 is not prime
+    sieve[0] = False
+    for i in range(1, (isqrt(limit) + 1) // 2):
+        if sieve[i]:
+            p = 2*i + 1
+            # p*p is the first multiple that needs to be crossed,
+            # and a step of p on indexes is a step of 2p on integers
+            sieve[p*p // 2::p] = False
+    odds = 2 * np.flatnonzero(sieve) + 1
+    return np.concatenate(([2], odds)).astype(np.int64)
+
+
+def _sieve_segment(lo, hi, base):
+    """
+    the primes in [lo, hi), as a numpy array
+
+    Parameters:
+      lo: an odd integer
+      hi: the end of the segment
+      base: a numpy array of the odd primes at least up to sqrt(hi)
+    """
+    # segment[i] is about the odd integer lo + 2*i
+    size = (hi - lo + 1) // 2
+    segment = np.ones(size, dtype=bool)
+    base = base[base * base < hi]
+    # the first odd multiple of each p that needs to be crossed
+    starts = np.maximum(base * base, (lo + base - 1) // base * base)
+    starts += (starts % 2 == 0) * base
+    starts = (starts - lo) // 2
+    # a step of p on indexes is a step of 2p on integers
+    # so primes above size cross at most one index, and
+    # these can be dealt with all at once
+    nb_small = np.searchsorted(base, size)
+    for p, start in zip(base[:nb_small].tolist(),
+                        starts[:nb_small].tolist()):
+        segment[start::p] = False
+    starts = starts[nb_small:]
+    segment[starts[starts < size]] = False
+    if lo == 1:
+        segment[0] = False
+    return lo + 2 * np.flatnonzero(segment)
+
+
+def _prime_blocks(start=0, stop=None):
+    """
+    the primes in [start, stop) - or above start if stop is None -
+    as a sequence of numpy arrays, one per segment
+    """
+    if start <= 2 and (stop is None or stop > 2):
+        yield np.array([2], dtype=np.int64)
+    # the beginning of a segment is always odd
+    lo = max(3, start | 1)
+    # the odd base primes, up to limit
+    base, limit = np.empty(0, dtype=np.int64), 1
+    while stop is None or lo < stop:
+        hi = lo + 2 * SEGMENT_SIZE
+        if stop is not None:
+            hi = min(hi, stop)
+        root = isqrt(hi - 1)
+        if root > limit:
+            # grow by at least a factor 2, to not do this too often
+            limit = max(root, 2 * limit)
+            base = _small_primes(limit)[1:]
+        yield _sieve_segment(lo, hi, base)
+        lo = hi
+
+
+def primes_up_to(n):
+    """
+    all the primes <= n, as a numpy array
+    """
+    blocks = list(_prime_blocks(0, n + 1))
+    return np.concatenate([np.empty(0, dtype=np.int64)] + blocks)
+
+
+# all the primes() generators in the process share the primes
+# found so far in a single table; it is stored as an array of 64-bit
+# integers, that takes 8 bytes per prime vs about 36 in a list of ints
+from array import array
+import bisect
+import threading
+
+class PrimeTable:
+    """
+    the first prime numbers, in a table that grows on demand
+
+    Parameters:
+      max_primes: if set, the table never grows beyond that many primes,
+        i.e. 8*max_primes bytes
+    """
+
+    def __init__(self, max_primes=None):
+        self.primes = array('Q')
+        self.max_primes = max_primes
+        # a PrimeStore that gets the new primes, see below
+        self.store = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.primes)
+
+    def __getitem__(self, index):
+        return self.primes[index]
+
+    def full(self):
+        return (self.max_primes is not None
+                and len(self.primes) >= self.max_primes)
+
+    def grow(self):
+        """
+        append the primes of one more segment
+
+        Returns:
+          False if the table is full, True otherwise
+        """
+        with self._lock:
+            if self.full():
+                return False
+            table = self.primes
+            if not table:
+                new = _small_primes(2 * SEGMENT_SIZE)
+            else:
+                lo = table[-1] + 2
+                hi = lo + 2 * SEGMENT_SIZE
+                # the base primes are already in the table
+                nb_base = bisect.bisect_right(table, isqrt(hi))
+                base = np.frombuffer(table[1:nb_base], dtype=np.uint64)
+                new = _sieve_segment(lo, hi, base.astype(np.int64))
+            if self.max_primes is not None:
+                new = new[:self.max_primes - len(table)]
+            table.frombytes(new.astype(np.uint64).tobytes())
+            if self.store is not None:
+                self.store.save(table)
+            return True
+
+    def ensure(self, count):
+        """
+        grow the table until it has at least count primes
+
+        Returns:
+          False if the table is full before that
+        """
+        while len(self.primes) < count:
+            if not self.grow():
+                return False
+        return True
+
+    def clear(self):
+        with self._lock:
+            self.primes = array('Q')
+
+
+prime_table = PrimeTable()
+
+
+def nth_prime(k):
+    """
+    the prime at index k in primes(), i.e. nth_prime(0) == 2
+
+    this is a mere lookup once prime_table has grown that far;
+    if the table is capped and k is beyond, we start from
+    a lower bound of the result, count the primes below it
+    with prime_pi(), and sieve from there
+    """
+    if prime_table.ensure(k + 1):
+        return prime_table[k]
+    # with n = k+1, the n-th prime is at least n * (ln n + ln ln n - 1)
+    # (Dusart, 1999), this is where we start sieving
+    n = k + 1
+    start = int(n * (log(n) + log(log(n)) - 1)) if n > 2 else 0
+    if len(prime_table):
+        start = max(start, prime_table[-1] + 1)
+    # the rank of the result among the primes >= start
+    k -= prime_pi(start - 1)
+    for block in _prime_blocks(start):
+        if k < len(block):
+            return int(block[k])
+        k -= len(block)
+
+
+# below that, prime_pi() just counts the primes from the sieve
+PI_SIEVE_LIMIT = 10**7
+
+def prime_pi(x):
+    """
+    the number of primes <= x
+
+    from the prime table if it goes that far, from the sieve
+    for small values of x, and otherwise with _legendre_pi()
+    """
+    if x < 2:
+        return 0
+    table = prime_table.primes
+    if len(table) and x <= table[-1]:
+        return bisect.bisect_right(table, x)
+    if x <= PI_SIEVE_LIMIT:
+        return sum(len(block) for block in _prime_blocks(0, x + 1))
+    return _legendre_pi(x)
+
+
+def _legendre_pi(x):
+    """
+    the number of primes <= x, in about x**(3/4) operations
+
+    this counts, in the spirit of Legendre's formula, the integers that
+    are left after crossing the multiples of each prime p up to sqrt(x);
+    it turns out we only need these counts for the values x // i,
+    of which there are only 2*sqrt(x); this version is known as
+    Lucy Hedgehog's algorithm, it is vectorized with numpy here
+    """
+    r = isqrt(x)
+    # for v <= r, small[v] is the count for v, and
+    # for i <= r, large[i] is the count for x // i
+    # i.e. at first the number of integers in 2..v
+    small = np.arange(-1, r, dtype=np.int64)
+    small[0] = 0
+    large = np.zeros(r + 1, dtype=np.int64)
+    large[1:] = x // np.arange(1, r + 1) - 1
+    for p in primes_up_to(r).tolist():
+        # the count of primes < p
+        sp = small[p - 1]
+        p2 = p * p
+        # the values x // i that are >= p2
+        imax = min(r, x // p2)
+        # among them, the ones where x // (i*p) is in large
+        split = min(imax, r // p)
+        large[1:split+1] -= large[p:split*p+1:p] - sp
+        # and the ones where it is in small
+        if imax > split:
+            others = x // (np.arange(split + 1, imax + 1) * p)
+            large[split+1:imax+1] -= small[others] - sp
+        # the small values >= p2
+        if r >= p2:
+            values = np.arange(p2, r + 1)
+            small[p2:] -= small[values // p] - sp
+    return int(large[1])
+
+
+# processes that restart often can save the prime table in a file,
+# so they don't need to sieve again; to keep the file small
+# we store the gaps between consecutive primes, divided by 2,
+# on 16 bits each, which is more than enough for all 64-bit primes
+import os
+import mmap
+import struct
+try:
+    import fcntl
+except ImportError:
+    # no locking on windows
+    fcntl = None
+
+class PrimeStore:
+    """
+    the first prime numbers, saved in a file
+
+    the file has a header with the number of primes,
+    followed by the half-gaps between consecutive primes from 3 on
+    """
+
+    MAGIC = b'PRIMES01'
+    HEADER = struct.Struct('=8sQ')
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def _lock(self, file, exclusive):
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def _count(self, file):
+        file.seek(0)
+        header = file.read(self.HEADER.size)
+        if len(header) < self.HEADER.size:
+            return 0
+        magic, count = self.HEADER.unpack(header)
+        if magic != self.MAGIC:
+            raise ValueError(f"{self.filename}: not a prime store")
+        return count
+
+    def load(self, max_primes=None):
+        """
+        Returns:
+          the stored primes - at most max_primes - as an array('Q')
+        """
+        primes = array('Q')
+        try:
+            file = open(self.filename, 'rb')
+        except FileNotFoundError:
+            return primes
+        with file:
+            self._lock(file, exclusive=False)
+            count = self._count(file)
+            if max_primes is not None:
+                count = min(count, max_primes)
+            if count < 2:
+                return primes[:0] if count == 0 else array('Q', [2])
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                gaps = np.frombuffer(mapped, dtype=np.uint16,
+                                     count=count - 2, offset=self.HEADER.size)
+                odds = 3 + 2 * np.cumsum(gaps, dtype=np.uint64)
+                # release the mapping
+                del gaps
+            primes.frombytes(np.uint64([2, 3]).tobytes())
+            primes.frombytes(odds.tobytes())
+        return primes
+
+    def save(self, primes):
+        """
+        append to the file the primes it does not have yet
+
+        Parameters:
+          primes: an array('Q') of the first primes
+        """
+        if len(primes) < 2:
+            return
+        # 'a+b' would always write at the end, and 'w+b' would
+        # truncate the file, maybe while another process writes in it
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o666)
+        with open(fd, 'r+b') as file:
+            self._lock(file, exclusive=True)
+            # another process may have gone further already
+            count = max(2, self._count(file))
+            if count >= len(primes):
+                return
+            new = np.frombuffer(primes, dtype=np.uint64)[count-1:]
+            gaps = (np.diff(new) // 2).astype(np.uint16)
+            del new
+            file.seek(self.HEADER.size + 2 * (count - 2))
+            file.write(gaps.tobytes())
+            # the header is written last, so that readers
+            # never see primes that are not fully written
+            file.seek(0)
+            file.write(self.HEADER.pack(self.MAGIC, len(primes)))
+
+
+def open_prime_store(filename, table=None):
+    """
+    fill the prime table from a file, and attach the file to the table
+    so that the primes found from then on are saved as well
+    """
+    table = prime_table if table is None else table
+    store = PrimeStore(filename)
+    primes = store.load(table.max_primes)
+    with table._lock:
+        if len(primes) > len(table.primes):
+            table.primes = primes
+        table.store = store
+    store.save(table.primes)
+    return store
+
+
+# for big ranges of integers, segments can be sieved in parallel
+# the base primes are computed once, and sent once to each worker
+from concurrent.futures import ProcessPoolExecutor
+from parallel import bounded_map
+
+# the number of integers in the range of one task
+TASK_SIZE = 64 * SEGMENT_SIZE
+
+
+def _sieve_range(lo, hi, base):
+    """
+    the primes in [lo, hi), sieved segment by segment,
+    as one numpy array
+    """
+    blocks = [np.empty(0, dtype=np.int64)]
+    if lo <= 2 < hi:
+        blocks.append(np.array([2], dtype=np.int64))
+    start = max(3, lo | 1)
+    while start < hi:
+        stop = min(start + 2 * SEGMENT_SIZE, hi)
+        blocks.append(_sieve_segment(start, stop, base))
+        start = stop
+    return np.concatenate(blocks)
+
+
+# the base primes in each worker process
+_worker_base = None
+
+def _worker_init(base):
+    global _worker_base
+    _worker_base = base
+
+
+def _worker_sieve(lo, hi):
+    return _sieve_range(lo, hi, _worker_base)
+
+
+def primes_in_range(lo, hi, workers=None):
+    """
+    enumerate the primes in [lo, hi), in increasing order
+
+    the range is cut into tasks that are sieved on a pool of
+    processes; results are yielded as soon as they are available,
+    in order, and only a few tasks are run ahead of the consumer
+
+    Parameters:
+      workers: the number of processes, defaults to the number of cores;
+        with 1 worker everything runs in the current process
+    """
+    base = _small_primes(isqrt(max(hi - 1, 0)))[1:]
+    tasks = ((start, min(start + TASK_SIZE, hi))
+             for start in range(lo, hi, TASK_SIZE))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for start, stop in tasks:
+            yield from _sieve_range(start, stop, base).tolist()
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_worker_init,
+                             initargs=(base,)) as executor:
+        submit = lambda task: executor.submit(_worker_sieve, *task)
+        for block in bounded_map(submit, tasks, 2 * workers):
+            yield from block.tolist()
+
+
+# to know if one big number is prime, a sieve is not the right tool;
+# the Miller-Rabin test is probabilistic in general, but it is known
+# to be exact for all n below some bound with a given set of bases
+import random
+
+# with these bases, the test is exact below _MR_LIMIT, i.e. on 64 bits;
+# _MR_LIMIT itself is the smallest composite that passes them all
+_MR_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+_MR_LIMIT = 318_665_857_834_031_151_167_461
+
+def _is_witness(a, n, d, s):
+    """
+    whether a proves that the odd n is composite,
+    with n - 1 == d * 2**s and d odd
+    """
+    x = pow(a, d, n)
+    if x == 1 or x == n - 1:
+        return False
+    for _ in range(s - 1):
+        x = x * x % n
+        if x == n - 1:
+            return False
+    return True
+
+
+def is_prime(n, rounds=20):
+    """
+    whether n is prime, with the Miller-Rabin test
+
+    the answer is exact for n below 3.18e23, which covers all
+    64-bit integers; above that, rounds random bases are
+    tried in addition, and a composite number has a chance
+    below 4**-rounds to be reported as prime
+
+    >>> is_prime(318_665_857_834_031_151_167_461)  # 399165290221*798330580441
+    False
+    """
+    if n < 2:
+        return False
+    for p in _MR_BASES:
+        if n % p == 0:
+            return n == p
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d, s = d // 2, s + 1
+    bases = _MR_BASES
+    if n >= _MR_LIMIT:
+        bases += tuple(random.randrange(2, n - 1) for _ in range(rounds))
+    return not any(_is_witness(a, n, d, s) for a in bases)
+
+
+def next_prime(n):
+    """
+    the smallest prime > n
+    """
+    if n < 2:
+        return 2
+    # the next odd number
+    candidate = n + 1 + n % 2
+    while not is_prime(candidate):
+        candidate += 2
+    return candidate
+
+
+def prev_prime(n):
+    """
+    the largest prime < n
+    """
+    if n <= 2:
+        raise ValueError(f"no prime below {n}")
+    if n == 3:
+        return 2
+    # the previous odd number
+    candidate = n - 1 - n % 2
+    while not is_prime(candidate):
+        candidate -= 2
+    return candidate
+
+
+# on numbers below 2**32, products modulo n fit in 64 bits,
+# so the test can be run on a whole numpy array at once;
+# and at that scale, these 3 bases are enough
+_MR_BASES_32 = (2, 7, 61)
+
+def _powmod_array(base, exponent, modulus):
+    """
+    base ** exponent % modulus, elementwise on uint64 arrays
+    """
+    result = np.ones_like(modulus)
+    base = base % modulus
+    exponent = exponent.copy()
+    while exponent.any():
+        odd = (exponent & 1).astype(bool)
+        result = np.where(odd, result * base % modulus, result)
+        base = base * base % modulus
+        exponent >>= np.uint64(1)
+    return result
+
+
+def is_prime_array(candidates):
+    """
+    same as is_prime, on a numpy array of non-negative integers
+
+    Returns:
+      a boolean array of the same shape
+    """
+    candidates = np.asarray(candidates)
+    if candidates.dtype == object or candidates.min(initial=0) < 0:
+        return np.array([is_prime(int(n)) for n in candidates.ravel()],
+                        dtype=bool).reshape(candidates.shape)
+    n = candidates.astype(np.uint64).ravel()
+    result = np.zeros(n.shape, dtype=bool)
+    # deal with the big ones one by one
+    big = np.flatnonzero(n >= 2**32)
+    result[big] = [is_prime(int(x)) for x in n[big]]
+    todo = (n >= 2) & (n < 2**32)
+    # trial division by the first primes
+    for p in _MR_BASES:
+        divisible = todo & (n % np.uint64(p) == 0)
+        result[divisible] = n[divisible] == p
+        todo &= ~divisible
+    # Miller-Rabin on the remaining ones
+    index = np.flatnonzero(todo)
+    m = n[index]
+    # m - 1 == d * 2**s with d odd
+    d, s = m - np.uint64(1), np.zeros_like(m)
+    while True:
+        even = d % np.uint64(2) == 0
+        if not even.any():
+            break
+        d[even] >>= np.uint64(1)
+        s[even] += np.uint64(1)
+    prime = np.ones(m.shape, dtype=bool)
+    for a in _MR_BASES_32:
+        x = _powmod_array(np.full_like(m, a), d, m)
+        # a base is not a witness for itself
+        passed = (x == 1) | (x == m - np.uint64(1)) | (m == a)
+        for r in range(1, int(s.max(initial=0))):
+            x = x * x % m
+            passed |= (x == m - np.uint64(1)) & (np.uint64(r) < s)
+        prime &= passed
+    result[index] = prime
+    return result.reshape(candidates.shape)
+
+
 # @BEG@ name=primes
+def primes():
+    """
+    enumerate prime numbers
+
+    the primes come from prime_table, see above,
+    and are computed by blocks with the sieve when needed
+    """
+    table = prime_table
+    index = 0
+    while index < len(table) or table.grow():
+        # copy a few primes at a time, as the table may grow meanwhile
+        chunk = table.primes[index:index+4096]
+        index += len(chunk)
+        yield from chunk
+    # the table is full, so go on without storing anything
+    start = table[-1] + 1 if len(table) else 0
+    for block in _prime_blocks(start):
+        # tolist() turns numpy integers into regular Python ints
+        yield from block.tolist()
+# @END@
+
+
+# @BEG@ name=primes more=bis
 import math
 import itertools
 
-def primes():
+def primes_bis():
     """
-    enumerate prime numbers
+    same, using trial divisions by the primes found so far
     """
     # the primes we have found so far
     previous = [2, 3]
@@ -52,6 +659,29 @@ exo_primes = ExerciseGenerator(
 primes_ko = itertools.count
 
 
+# when millions of primes are needed, going through a generator
+# for each one is what costs the most; so we also offer to get
+# them by batches, as numpy arrays
+def primes_batches(size):
+    """
+    same as primes(), but yields numpy arrays of size primes
+    """
+    table = prime_table
+    index = 0
+    while table.ensure(index + size):
+        # the slice is a copy, so the table can still grow
+        yield np.frombuffer(table.primes[index:index+size], dtype=np.int64)
+        index += size
+    # the table is full, so go on without storing anything
+    pending = np.frombuffer(table.primes[index:], dtype=np.int64)
+    start = table[-1] + 1 if len(table) else 0
+    for block in _prime_blocks(start):
+        pending = np.concatenate((pending, block))
+        while len(pending) >= size:
+            yield pending[:size]
+            pending = pending[size:]
+
+
 
 # prime-squares
 
@@ -87,6 +717,17 @@ exo_prime_squares = ExerciseGenerator(
 )
 
 
+def prime_squares_batches(size):
+    """
+    same as prime_squares(), by batches as in primes_batches()
+
+    note that squares no longer fit in 64 bits above 3e9,
+    i.e. after the first 146 millions primes or so
+    """
+    for block in primes_batches(size):
+        yield block * block
+
+
 
 ### LEGOs
 
@@ -149,6 +790,21 @@ def prime_th_primes():
     given that primes() emits 2, 3, 5
     then prime_th_primes() starts with 5 which has index 2 in that enumeration
     """
+    # primes() and nth_prime() both read the shared prime table
+    # so nothing is computed twice, and there is nothing to buffer
+    for index in primes():
+        yield nth_prime(index)
+# @END@
+
+
+# @BEG@ name=prime_th_primes more=tee
+def prime_th_primes_tee():
+    """
+    same purpose, walking two copies of the primes() stream
+
+    this was the way to go before primes() used a shared table;
+    tee() needs to buffer everything between the two copies
+    """
     # optimizing a bit, don't compute primes twice
     primes1, primes2 = itertools.tee(primes())
 
@@ -224,6 +880,23 @@ def differential(iterator):
         previous = current
 
 
+def differential_batches(iterator):
+    """
+    same as differential(), on an iterator of numpy arrays
+
+    yields arrays of the same sizes as the input ones,
+    except for the first one that has one item less
+    """
+    previous = None
+    for block in iterator:
+        if previous is None:
+            yield np.diff(block)
+        else:
+            yield np.diff(block, prepend=previous)
+        if len(block):
+            previous = block[-1]
+
+
 def squares():
     return (i**2 for i in itertools.count())
 
@@ -0,0 +1,84 @@
+"""
+benchmarks for gen_primes
+
+times each generator when taking its first n values for growing n,
+and records the peak memory, where e.g. the buffers of tee()
+show up; results are written in a JSON file, see benchmark.py
+
+run e.g.
+    python gen_primes_bench.py --lengths 1000,10000
+"""
+
+import itertools
+from argparse import ArgumentParser
+
+from benchmark import measure, save_results, compare_results
+import gen_primes
+from gen_primes import (
+    primes, primes_bis, prime_squares, prime_squares_bis,
+    prime_legos, prime_legos_bis,
+    prime_th_primes, prime_th_primes_bis, prime_th_primes_tee,
+)
+
+GENERATORS = [
+    primes, primes_bis, prime_squares, prime_squares_bis,
+    prime_legos, prime_legos_bis,
+    prime_th_primes, prime_th_primes_bis, prime_th_primes_tee,
+]
+
+
+def consume(generator_function, length, warm):
+    """
+    take the first length values of a generator
+
+    unless warm is set, the shared prime table is emptied first,
+    so that each call starts from scratch
+    """
+    if not warm:
+        gen_primes.prime_table.clear()
+    for _ in itertools.islice(generator_function(), length):
+        pass
+
+
+def run(lengths, names, warm, repeat):
+    records = []
+    for length in lengths:
+        for generator_function in GENERATORS:
+            name = generator_function.__name__
+            if names and name not in names:
+                continue
+            measures, _ = measure(consume, generator_function, length,
+                                  warm, repeat=repeat)
+            records.append(dict(generator=name, length=length, warm=warm,
+                                **measures))
+            print(f"{name:22} {length:>9} "
+                  f"{measures['seconds']:10.4f}s "
+                  f"{measures['peak_bytes']:>12}B")
+    return records
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--lengths", default="1000,10000,100000",
+                        help="comma-separated numbers of values to take")
+    parser.add_argument("--generators", default="",
+                        help="comma-separated names, default is all")
+    parser.add_argument("--warm", action='store_true',
+                        help="do not empty the shared prime table"
+                             " between calls")
+    parser.add_argument("--repeat", default=3, type=int)
+    parser.add_argument("--output", default="gen_primes_bench.json")
+    parser.add_argument("--compare", default=None,
+                        help="a previous output to compare with")
+    args = parser.parse_args()
+
+    lengths = [int(length) for length in args.lengths.split(',')]
+    names = [name for name in args.generators.split(',') if name]
+    records = run(lengths, names, args.warm, args.repeat)
+    save_results(args.output, 'gen_primes', records)
+    if args.compare:
+        compare_results(args.compare, records)
+
+
+if __name__ == '__main__':
+    main()
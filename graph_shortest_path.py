@@ -60,6 +60,383 @@ def parse_graph2(filename):
     return g
 
 
+#
+# compact representation
+#
+
+# dicts of dicts are convenient, but each vertex costs a whole dict
+# and each edge costs a dict slot plus a Python int;
+# we can do much better by storing the graph in flat arrays
+from array import array
+from collections.abc import Mapping
+import sys
+
+def _interner():
+    """
+    Returns:
+      a tuple (names, intern) where intern(name) returns
+      the id of name, and appends it to names if it is new
+    """
+    names, ids = [], {}
+    def intern(name):
+        i = ids.get(name)
+        if i is None:
+            i = ids[name] = len(names)
+            names.append(name)
+        return i
+    return names, intern
+
+
+class CSRGraph(Mapping):
+    """
+    a graph stored in compressed sparse row (CSR) format
+
+    vertices are interned into integer ids in the 0..n-1 range, and
+    the successors of vertex i are described by
+
+    * targets[offsets[i]:offsets[i+1]] - the ids of the successors
+    * weights[offsets[i]:offsets[i+1]] - the corresponding weights
+
+    offsets, targets and weights are flat arrays of machine numbers;
+    a CSRGraph can also be read like a dict of dicts,
+    i.e. graph[src][dst] is the weight of the src -> dst edge,
+    so the functions in this module work on it as well
+
+    Notes:
+      - unlike with parse_graph1, all the vertices have a key,
+        including the ones with no outgoing edge
+      - the input is expected to have no duplicate edge
+    """
+
+    def __init__(self, names, offsets, targets, weights):
+        # id -> name
+        self.names = names
+        # name -> id
+        self.ids = {name: i for i, name in enumerate(names)}
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+
+    @classmethod
+    def from_file(cls, filename: str):
+        """
+        same input format as parse_graph1, read in one pass
+        """
+        names, intern = _interner()
+        sources, targets, weights = array('i'), array('i'), array('q')
+        with open(filename) as feed:
+            for line in feed:
+                src, dst, weight = line.split(',')
+                sources.append(intern(src.strip()))
+                targets.append(intern(dst.strip()))
+                weights.append(int(weight.strip()))
+        return cls._from_edges(names, sources, targets, weights)
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        convert a graph implemented as a dict of dicts,
+        e.g. as returned by parse_graph1 or planar1
+        """
+        names, intern = _interner()
+        # weights in a dict of dicts may be floats
+        typecode = 'q'
+        if any(isinstance(w, float)
+               for adj in graph.values() for w in adj.values()):
+            typecode = 'd'
+        sources, targets, weights = array('i'), array('i'), array(typecode)
+        for s, adj in graph.items():
+            i = intern(s)
+            for d, w in adj.items():
+                sources.append(i)
+                targets.append(intern(d))
+                weights.append(w)
+        return cls._from_edges(names, sources, targets, weights)
+
+    @classmethod
+    def _from_edges(cls, names, sources, targets, weights):
+        """
+        build the CSR arrays from a list of edges in any order
+        using a counting sort on the source ids
+        """
+        nb_vertices = len(names)
+        offsets = array('q', bytes(8 * (nb_vertices + 1)))
+        # count the outgoing edges of each vertex
+        for s in sources:
+            offsets[s+1] += 1
+        # cumulate them
+        for i in range(nb_vertices):
+            offsets[i+1] += offsets[i]
+        # where to store the next edge for each source
+        position = offsets[:-1]
+        sorted_targets = array('i', bytes(4 * len(targets)))
+        sorted_weights = array(weights.typecode, bytes(
+            weights.itemsize * len(weights)))
+        for s, d, w in zip(sources, targets, weights):
+            p = position[s]
+            sorted_targets[p] = d
+            sorted_weights[p] = w
+            position[s] = p + 1
+        return cls(names, offsets, sorted_targets, sorted_weights)
+
+    # the number of vertices and edges
+    def nb_vertices(self):
+        return len(self.names)
+
+    def nb_edges(self):
+        return len(self.targets)
+
+    # the dict-of-dicts read view
+    def __getitem__(self, name):
+        return _CSRAdjacency(self, self.ids[name])
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def footprint(self):
+        """
+        the memory used by the graph, in bytes
+        """
+        # the buffers may be arrays or memoryviews (see load_graph)
+        return (sum(memoryview(x).nbytes for x in (
+                    self.offsets, self.targets, self.weights))
+                + sys.getsizeof(self.names) + sys.getsizeof(self.ids)
+                + sum(sys.getsizeof(name) for name in self.names))
+
+
+class _CSRAdjacency(Mapping):
+    """
+    the read-only adjacency dict of one vertex in a CSRGraph
+    """
+
+    def __init__(self, graph, i):
+        self.graph = graph
+        self.start = graph.offsets[i]
+        self.end = graph.offsets[i+1]
+
+    def __getitem__(self, name):
+        graph = self.graph
+        j = graph.ids.get(name)
+        # a linear search, but the degree is usually small
+        for p in range(self.start, self.end):
+            if graph.targets[p] == j:
+                return graph.weights[p]
+        raise KeyError(name)
+
+    def __iter__(self):
+        names = self.graph.names
+        for j in self.graph.targets[self.start:self.end]:
+            yield names[j]
+
+    def __len__(self):
+        return self.end - self.start
+
+    # much faster than the default, that would do a lookup for each key
+    def items(self):
+        graph, start, end = self.graph, self.start, self.end
+        names = graph.names
+        return zip((names[j] for j in graph.targets[start:end]),
+                   graph.weights[start:end])
+
+
+def footprint(graph):
+    """
+    an estimate of the memory used by a graph, in bytes
+
+    works on a CSRGraph as well as on a dict of dicts,
+    so the 2 representations can be compared
+    """
+    if isinstance(graph, CSRGraph):
+        return graph.footprint()
+    # vertices appear several times, count them only once
+    seen = set()
+    def size(obj):
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        return sys.getsizeof(obj)
+    total = size(graph)
+    for s, adj in graph.items():
+        total += size(s) + size(adj)
+        for d, w in adj.items():
+            total += size(d) + size(w)
+    return total
+
+
+def compare_footprints(filename: str):
+    """
+    load the same file in both representations
+
+    Returns:
+      a dict with the footprint, in bytes, of each representation
+    """
+    return {
+        'dict': footprint(parse_graph1(filename)),
+        'csr': footprint(CSRGraph.from_file(filename)),
+    }
+
+
+#
+# fast loading
+#
+
+# parsing line by line is slow on big files; a first improvement
+# is to split whole blocks of text at once, and a second one is
+# to not parse at all, by keeping the CSR arrays in a binary file
+# next to the input, that we can just map in memory next time
+import os
+import mmap
+import struct
+
+def parse_graph3(filename: str, chunk_size=1 << 22):
+    """
+    same as CSRGraph.from_file, but reads the input in big chunks
+
+    Parameters:
+      filename: the input file path from current directory
+      chunk_size: the size in bytes of the chunks read at once
+    Returns:
+      a CSRGraph
+
+    Notes:
+      the input is expected to have exactly one edge per line,
+      and like in parse_graph1, tokens may contain extra spaces
+    """
+    names, intern = _interner()
+    sources, targets, weights = array('i'), array('i'), array('q')
+
+    def parse_block(block):
+        # turn the block into a flat list of fields
+        # src, dst, weight, src, dst, weight, ...
+        block = block.rstrip()
+        if not block:
+            return
+        # each line must be checked: only checking the total number
+        # of fields would pair a line with 4 fields with one with 2
+        lines = block.split(b'\n')
+        if {line.count(b',') for line in lines} != {2}:
+            raise ValueError(f"{filename}: expected 3 fields per line")
+        fields = b','.join(lines).split(b',')
+        sources.extend(map(intern, map(bytes.strip, fields[0::3])))
+        targets.extend(map(intern, map(bytes.strip, fields[1::3])))
+        # int() ignores surrounding whitespace
+        weights.extend(map(int, fields[2::3]))
+
+    with open(filename, 'rb') as feed:
+        # the incomplete line at the end of the previous chunk
+        rest = b''
+        while chunk := feed.read(chunk_size):
+            chunk = rest + chunk
+            cut = chunk.rfind(b'\n') + 1
+            parse_block(chunk[:cut])
+            rest = chunk[cut:]
+        parse_block(rest)
+    names = [name.decode() for name in names]
+    return CSRGraph._from_edges(names, sources, targets, weights)
+
+
+# the layout of the cache file is
+# * a header: magic, mtime and size of the input file,
+#   number of vertices, number of edges, size of the names
+# * the offsets, weights and targets arrays, in this order
+# * the vertex names, utf-8 encoded and separated by newlines
+_CACHE_MAGIC = b'CSRGRPH1'
+_CACHE_HEADER = struct.Struct('=8sqqqqq')
+
+def _cache_key(filename):
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _save_cache(graph, cachename, key):
+    mtime, size = key
+    names = '\n'.join(graph.names).encode()
+    # write in a temporary file first, so that a concurrent
+    # reader never sees a half-written cache
+    tmpname = f"{cachename}.{os.getpid()}.tmp"
+    with open(tmpname, 'wb') as output:
+        output.write(_CACHE_HEADER.pack(
+            _CACHE_MAGIC, mtime, size,
+            graph.nb_vertices(), graph.nb_edges(), len(names)))
+        for buffer in (graph.offsets, graph.weights, graph.targets):
+            output.write(memoryview(buffer))
+        output.write(names)
+    os.replace(tmpname, cachename)
+
+
+def _load_cache(cachename, key):
+    """
+    Returns:
+      a CSRGraph whose arrays are mapped on the cache file,
+      or None if the cache is missing or out of date
+    """
+    try:
+        with open(cachename, 'rb') as feed:
+            mapped = mmap.mmap(feed.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    view = memoryview(mapped)
+    header = _CACHE_HEADER.size
+    if len(view) < header:
+        return None
+    magic, mtime, size, nb_vertices, nb_edges, names_size = (
+        _CACHE_HEADER.unpack(view[:header]))
+    if magic != _CACHE_MAGIC or (mtime, size) != key:
+        return None
+    # a truncated or corrupted file is ignored as well
+    expected = header + 8 * (nb_vertices + 1) + 12 * nb_edges + names_size
+    if min(nb_vertices, nb_edges, names_size) < 0 or len(view) != expected:
+        return None
+    try:
+        # the memoryviews keep the mapping alive
+        start = header
+        end = start + 8 * (nb_vertices + 1)
+        offsets = view[start:end].cast('q')
+        start, end = end, end + 8 * nb_edges
+        weights = view[start:end].cast('q')
+        start, end = end, end + 4 * nb_edges
+        targets = view[start:end].cast('i')
+        names = bytes(view[end:end+names_size]).decode()
+    except (TypeError, ValueError):
+        return None
+    names = names.split('\n') if nb_vertices else []
+    if len(names) != nb_vertices:
+        return None
+    return CSRGraph(names, offsets, targets, weights)
+
+
+def load_graph(filename: str, cache=True):
+    """
+    load a graph file into a CSRGraph, using a binary cache
+
+    the cache is a file named after the input, with a .csr extension;
+    it is used only if it was made from a file with the same
+    modification time and size; otherwise the input is parsed
+    with parse_graph3, and the cache is (re)created
+
+    Parameters:
+      filename: the input file path from current directory
+      cache: set to False to neither use nor create the cache
+    Returns:
+      a CSRGraph
+    """
+    if not cache:
+        return parse_graph3(filename)
+    cachename = filename + '.csr'
+    key = _cache_key(filename)
+    graph = _load_cache(cachename, key)
+    if graph is None:
+        graph = parse_graph3(filename)
+        _save_cache(graph, cachename, key)
+    return graph
+
+
 #
 # number of vertices
 #
@@ -113,6 +490,87 @@ def reachables1(graph, s):
             reached.update(news)
 
 
+def reachables2(graph, s):
+    """
+    same as reachables1, but linear in the size of the graph
+
+    in reachables1 each iteration scans all the vertices reached so far;
+    here we only expand the frontier, i.e. the vertices
+    that were discovered during the previous iteration
+    """
+    reached = {s}
+    frontier = [s]
+    while frontier:
+        news = []
+        for v in frontier:
+            for next in graph.get(v, {}):
+                if next not in reached:
+                    reached.add(next)
+                    news.append(next)
+        frontier = news
+    return reached
+
+
+def reachables_ids(graph, s):
+    """
+    same as reachables2, but on the integer ids of a CSRGraph
+
+    Parameters:
+      graph: a CSRGraph
+      s: the id of the source vertex
+    Returns:
+      a bytearray mask, where mask[i] is 1 iff vertex i is reachable
+    """
+    offsets, targets = graph.offsets, graph.targets
+    reached = bytearray(graph.nb_vertices())
+    reached[s] = 1
+    frontier = [s]
+    while frontier:
+        news = []
+        for v in frontier:
+            for next in targets[offsets[v]:offsets[v+1]]:
+                if not reached[next]:
+                    reached[next] = 1
+                    news.append(next)
+        frontier = news
+    return reached
+
+
+def reachables_many(graph, sources):
+    """
+    computes reachables2(graph, s) for all s in sources
+
+    the work is shared between sources: when a search meets a vertex
+    that was itself a source already dealt with, the vertices reachable
+    from there are known, so there is no need to explore them again
+
+    Returns:
+      a dict that maps each source to its set of reachable vertices
+    """
+    result = {}
+    for s in sources:
+        if s in result:
+            continue
+        reached = {s}
+        frontier = [s]
+        while frontier:
+            news = []
+            for v in frontier:
+                for next in graph.get(v, {}):
+                    if next in reached:
+                        continue
+                    known = result.get(next)
+                    if known is not None:
+                        # no need to go further from there
+                        reached |= known
+                    else:
+                        reached.add(next)
+                        news.append(next)
+            frontier = news
+        result[s] = reached
+    return result
+
+
 #
 # shortest path
 #
@@ -217,13 +675,8 @@ def shortest_path1(graph, v1, v2):
 
         # are we done ?
         if best_dst == v2:
-            path = [v2]
-            previous = best_src
-            while previous:
-                # print(f"inserting {previous}")
-                path.insert(0, previous)
-                previous = visited[previous][1]
-            return shortest_length, path
+            # see _path_to below
+            return shortest_length, _path_to(visited, v1, v2)
 
 
 #
@@ -285,13 +738,362 @@ def shortest_path2(graph, v1, v2):
 
         # are we done ?
         if best_dst == v2:
-            path = [v2]
-            previous = best_src
-            while previous:
-                # print(f"inserting {previous}")
-                path.insert(0, previous)
-                previous = visited[previous][1]
-            return shortest_length, path
+            # see _path_to below
+            return shortest_length, _path_to(visited, v1, v2)
+
+
+#
+# heap-based version
+#
+
+# the border is now kept in a priority queue, implemented
+# as a binary heap on top of a plain list
+import heapq
+import itertools
+
+def _dijkstra(graph, v1, targets=None):
+    """
+    the engine behind shortest_path_heap and shortest_paths_from
+
+    the border is a heap of candidate vertices, so selecting
+    the best one is O(log n) instead of a full scan;
+    entries are never removed from the heap, instead they are
+    just skipped when popped if their vertex is already visited
+    (this is known as lazy deletion)
+
+    Parameters:
+      graph: a graph described as a dictionary of dictionaries
+      v1: the source vertex
+      targets: an iterable of vertices; the search stops as soon
+        as they are all visited; if None, runs until all
+        reachable vertices are visited
+    Returns:
+      the visited dict, that maps each settled vertex
+      to a tuple (distance, previous)
+    """
+    visited = {}
+    # best distance found so far for vertices in the border
+    # this is just to avoid pushing useless entries in the heap
+    tentative = {v1: 0}
+    # the vertices we still need to find, if any
+    pending = None if targets is None else set(targets)
+    # the heap contains tuples (distance, tie, vertex, previous)
+    # tie is a counter that avoids comparing vertices
+    # when distances are equal, as vertices may not be comparable
+    tie = itertools.count()
+    border = [(0, next(tie), v1, None)]
+
+    while border:
+        distance, _, vertex, previous = heapq.heappop(border)
+        # lazy deletion: a vertex may have been pushed several times
+        # and only the first (i.e. the shortest) occurrence matters
+        if vertex in visited:
+            continue
+        visited[vertex] = (distance, previous)
+        # are we done ?
+        if pending is not None:
+            pending.discard(vertex)
+            if not pending:
+                break
+        # here again, not all vertices have a key in the dict
+        for dest, w in graph.get(vertex, {}).items():
+            if dest in visited:
+                continue
+            dist = distance + w
+            if dist < tentative.get(dest, math.inf):
+                tentative[dest] = dist
+                heapq.heappush(border, (dist, next(tie), dest, vertex))
+    return visited
+
+
+def _path_to(visited, v1, v2):
+    """
+    rebuild the path from v1 to v2 from the visited dict
+
+    the path is built backwards with append() and reversed
+    only once at the end, which is linear in its length;
+    inserting at the beginning of a list instead is linear
+    for each insertion, so quadratic overall
+
+    also we stop when reaching v1, and not on a false-ish previous
+    vertex, so that vertices like 0 or '' are dealt with properly
+    """
+    path = [v2]
+    vertex = v2
+    while vertex != v1:
+        _, vertex = visited[vertex]
+        path.append(vertex)
+    path.reverse()
+    return path
+
+
+class ShortestPathTree:
+    """
+    the result of a single-source search, i.e. the shortest paths
+    from one source to all the vertices settled by the search
+
+    it is a thin layer on top of the visited dict built by the search,
+    that maps each settled vertex to a tuple (distance, previous)
+    """
+
+    def __init__(self, source, visited):
+        self.source = source
+        self.visited = visited
+
+    def __contains__(self, vertex):
+        return vertex in self.visited
+
+    def __len__(self):
+        return len(self.visited)
+
+    def vertices(self):
+        """
+        the settled vertices, by increasing distance
+        """
+        return list(self.visited)
+
+    def distance(self, vertex):
+        """
+        the distance to vertex, or None if it was not settled
+        """
+        if vertex not in self.visited:
+            return None
+        return self.visited[vertex][0]
+
+    def path_to(self, vertex):
+        """
+        the shortest path to vertex, or None if it was not settled
+        """
+        if vertex not in self.visited:
+            return None
+        return _path_to(self.visited, self.source, vertex)
+
+    def distances(self, vertices=None):
+        """
+        the distances as a flat array of floats
+
+        Parameters:
+          vertices: an iterable of vertices; defaults to the
+            settled vertices in the order of the vertices() method
+        Returns:
+          an array('d'), with math.inf for vertices not settled
+        """
+        visited = self.visited
+        if vertices is None:
+            return array('d', (distance for distance, _ in visited.values()))
+        return array('d', (visited[v][0] if v in visited else math.inf
+                           for v in vertices))
+
+    def predecessors(self):
+        """
+        the tree itself, as a dict that maps each settled vertex
+        but the source to its predecessor on the shortest path
+        """
+        source = self.source
+        return {v: previous for v, (_, previous) in self.visited.items()
+                if v != source}
+
+
+def shortest_path_heap(graph, v1, v2, stats=None):
+    """
+    same as shortest_path2, but with the border in a heap
+
+    Parameters:
+      stats: an optional dict, where the number of settled vertices
+        is stored under the 'settled' key
+    Returns:
+      a tuple (distance, path), or None if v2 cannot be reached
+
+    Notes:
+      unlike shortest_path2, asking for v1 == v2
+      returns (0, [v1]) and not None
+    """
+    tree = shortest_tree(graph, v1, [v2])
+    if stats is not None:
+        stats['settled'] = len(tree)
+    if v2 not in tree:
+        return None
+    return tree.distance(v2), tree.path_to(v2)
+
+
+def shortest_tree(graph, v1, targets=None):
+    """
+    run a search from v1, like shortest_paths_from,
+    but return the whole ShortestPathTree
+    """
+    return ShortestPathTree(v1, _dijkstra(graph, v1, targets))
+
+
+def shortest_paths_from(graph, v1, targets=None):
+    """
+    the shortest paths from v1 to several vertices at once,
+    using one single search
+
+    Parameters:
+      graph: a graph described as a dictionary of dictionaries
+      v1: the source vertex
+      targets: an iterable of vertices, or None to mean
+        all the vertices reachable from v1
+    Returns:
+      a dict that maps each reachable target to a tuple
+      (distance, path); unreachable targets are left out
+    """
+    if targets is not None:
+        targets = set(targets)
+    tree = shortest_tree(graph, v1, targets)
+    if targets is None:
+        targets = tree.vertices()
+    return {
+        v: (tree.distance(v), tree.path_to(v))
+        for v in targets if v in tree
+    }
+
+
+#
+# bidirectional search
+#
+
+def reverse_graph(graph):
+    """
+    the graph with all edges reversed, as a dict of dicts
+    """
+    reverse = defaultdict(dict)
+    for s, adj in graph.items():
+        for d, w in adj.items():
+            reverse[d][s] = w
+    return dict(reverse)
+
+
+def shortest_path_bidirectional(graph, v1, v2, reverse=None, stats=None):
+    """
+    same as shortest_path_heap, but searching both
+    from v1 forwards and from v2 backwards
+
+    we stop as soon as the 2 balls are large enough to be sure
+    that no better path can be found, which in practice settles
+    far fewer vertices than a one-sided search
+
+    Parameters:
+      reverse: the reversed graph, as returned by reverse_graph;
+        it is computed if not provided, but for several queries
+        on the same graph it is much better to compute it once
+      stats: an optional dict, where the number of settled vertices
+        is stored under the 'settled' key
+    Returns:
+      a tuple (distance, path), or None if v2 cannot be reached
+    """
+    if reverse is None:
+        reverse = reverse_graph(graph)
+    graphs = (graph, reverse)
+    # everything comes in pairs, index 0 for forward, 1 for backward
+    # tentative maps each vertex to a tuple (distance, previous)
+    # where previous is towards v1 forwards, towards v2 backwards
+    tentative = ({v1: (0, None)}, {v2: (0, None)})
+    settled = (set(), set())
+    tie = itertools.count()
+    borders = ([(0, next(tie), v1)], [(0, next(tie), v2)])
+    # the best path found so far, and the vertex where both sides meet
+    best, meeting = (0, v1) if v1 == v2 else (math.inf, None)
+
+    def top(side):
+        # the smallest distance in the border, skipping stale entries
+        border = borders[side]
+        while border and border[0][2] in settled[side]:
+            heapq.heappop(border)
+        return border[0][0] if border else math.inf
+
+    while True:
+        top0, top1 = top(0), top(1)
+        # no path through unsettled vertices can beat the best one
+        if top0 + top1 >= best:
+            break
+        # expand the side that is the least advanced
+        side = 0 if top0 <= top1 else 1
+        distance, _, vertex = heapq.heappop(borders[side])
+        settled[side].add(vertex)
+        mine, other = tentative[side], tentative[1-side]
+        for dest, w in graphs[side].get(vertex, {}).items():
+            if dest in settled[side]:
+                continue
+            dist = distance + w
+            if dist < mine.get(dest, (math.inf,))[0]:
+                mine[dest] = (dist, vertex)
+                heapq.heappush(borders[side], (dist, next(tie), dest))
+                # has the other side already reached that vertex ?
+                if dest in other and dist + other[dest][0] < best:
+                    best, meeting = dist + other[dest][0], dest
+
+    if stats is not None:
+        stats['settled'] = len(settled[0]) + len(settled[1])
+    if meeting is None:
+        return None
+    forward = _path_to(tentative[0], v1, meeting)
+    backward = _path_to(tentative[1], v2, meeting)
+    backward.reverse()
+    return best, forward + backward[1:]
+
+
+#
+# A* search
+#
+
+def manhattan(v, target):
+    """
+    the Manhattan distance between 2 vertices
+    that are tuples of coordinates, like in planar1
+
+    it is an admissible heuristic for A* as long as each edge
+    costs at least the number of coordinate steps it makes
+    """
+    return sum(abs(a - b) for a, b in zip(v, target))
+
+
+def shortest_path_astar(graph, v1, v2, heuristic=manhattan, stats=None):
+    """
+    same as shortest_path_heap, but the border is ordered by
+    distance + heuristic(vertex, v2) instead of just distance,
+    so the search is directed towards v2
+
+    Parameters:
+      heuristic: a function (vertex, target) -> number that must
+        never overestimate the actual distance
+      stats: an optional dict, where the number of settled vertices
+        is stored under the 'settled' key
+    Returns:
+      a tuple (distance, path), or None if v2 cannot be reached
+
+    Notes:
+      if the heuristic is admissible but not consistent, a vertex
+      can be settled more than once; it is then counted each time
+    """
+    # the best known (distance, previous) for each vertex
+    best = {v1: (0, None)}
+    tie = itertools.count()
+    border = [(heuristic(v1, v2), next(tie), 0, v1)]
+    nb_settled = 0
+    found = False
+
+    while border:
+        _, _, distance, vertex = heapq.heappop(border)
+        # a better way to this vertex was found since it was pushed
+        if distance > best[vertex][0]:
+            continue
+        nb_settled += 1
+        if vertex == v2:
+            found = True
+            break
+        for dest, w in graph.get(vertex, {}).items():
+            dist = distance + w
+            if dist < best.get(dest, (math.inf,))[0]:
+                best[dest] = (dist, vertex)
+                heapq.heappush(border, (
+                    dist + heuristic(dest, v2), next(tie), dist, dest))
+
+    if stats is not None:
+        stats['settled'] = nb_settled
+    if not found:
+        return None
+    return best[v2][0], _path_to(best, v1, v2)
 
 
 # for tests
@@ -302,6 +1104,384 @@ def shortest_distance2(*args):
     except TypeError:
         return None
 
+#
+# many-to-many distances
+#
+
+# when a lot of distances are needed, it is much cheaper to run
+# one search per source than one per (source, target) pair;
+# and as the searches are independent, they can run in parallel
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+def _distances_ids(offsets, targets, weights, source, wanted):
+    """
+    the distances from source to the wanted vertices,
+    computed with a heap on the integer ids of a CSRGraph
+
+    Returns:
+      a dict id -> distance for the reachable wanted ids
+    """
+    settled = {}
+    tentative = {source: 0}
+    pending = set(wanted)
+    # ids are integers, so no need for a tie counter here
+    border = [(0, source)]
+    while border and pending:
+        distance, v = heapq.heappop(border)
+        if v in settled:
+            continue
+        settled[v] = distance
+        pending.discard(v)
+        for p in range(offsets[v], offsets[v+1]):
+            dest = targets[p]
+            if dest in settled:
+                continue
+            dist = distance + weights[p]
+            if dist < tentative.get(dest, math.inf):
+                tentative[dest] = dist
+                heapq.heappush(border, (dist, dest))
+    return {t: settled[t] for t in wanted if t in settled}
+
+
+# the shared memory block contains the offsets, weights and targets
+# arrays of a CSRGraph, in this order
+def _share_graph(graph):
+    """
+    copy the arrays of a CSRGraph in a new shared memory block
+
+    Returns:
+      the SharedMemory object, and the layout needed to read it back
+    """
+    buffers = [memoryview(buffer).cast('B') for buffer in
+               (graph.offsets, graph.weights, graph.targets)]
+    block = shared_memory.SharedMemory(
+        create=True, size=max(1, sum(len(b) for b in buffers)))
+    start = 0
+    for buffer in buffers:
+        block.buf[start:start+len(buffer)] = buffer
+        start += len(buffer)
+    layout = (graph.nb_vertices(), graph.nb_edges(),
+              memoryview(graph.weights).format)
+    return block, layout
+
+
+def _attach_graph(name, layout):
+    """
+    the reverse of _share_graph: map the arrays of a shared block
+
+    Returns:
+      the SharedMemory object, and the offsets, targets, weights views
+    """
+    nb_vertices, nb_edges, typecode = layout
+    try:
+        # python 3.13+: the block belongs to the parent process
+        block = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        block = shared_memory.SharedMemory(name=name)
+    view = block.buf
+    start, end = 0, 8 * (nb_vertices + 1)
+    offsets = view[start:end].cast('q')
+    start, end = end, end + array(typecode).itemsize * nb_edges
+    weights = view[start:end].cast(typecode)
+    start, end = end, end + 4 * nb_edges
+    targets = view[start:end].cast('i')
+    return block, offsets, targets, weights
+
+
+# in each worker process, the graph attached once and for all
+# by the pool initializer, and the wanted target ids
+_worker_graph = None
+_worker_wanted = None
+
+def _worker_init(name, layout, wanted):
+    global _worker_graph, _worker_wanted
+    _worker_graph = _attach_graph(name, layout)
+    _worker_wanted = wanted
+
+
+def _worker_distances(source):
+    _, offsets, targets, weights = _worker_graph
+    return _distances_ids(offsets, targets, weights, source, _worker_wanted)
+
+
+def distance_matrix(graph, sources, targets, workers=None):
+    """
+    the shortest distances between several sources and targets
+
+    there is one single search per distinct source, and the sources
+    are spread over a pool of worker processes; the graph is sent
+    to the workers once, through a shared memory block
+
+    Parameters:
+      graph: a dict of dicts, or a CSRGraph
+      sources: an iterable of vertices
+      targets: an iterable of vertices
+      workers: the number of processes, defaults to the number of cores;
+        with 1 worker everything runs in the current process
+    Returns:
+      a list of rows, one per source, of distances, one per target;
+      like with shortest_distance2, unreachable targets give None
+    """
+    if not isinstance(graph, CSRGraph):
+        graph = CSRGraph.from_graph(graph)
+    sources, targets = list(sources), list(targets)
+    ids = graph.ids
+    # the distinct sources that are in the graph
+    source_ids = list({ids[s]: None for s in sources if s in ids})
+    wanted = frozenset(ids[t] for t in targets if t in ids)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(source_ids))
+
+    if workers <= 1:
+        distances = [
+            _distances_ids(graph.offsets, graph.targets, graph.weights,
+                           source, wanted)
+            for source in source_ids]
+    else:
+        block, layout = _share_graph(graph)
+        try:
+            with ProcessPoolExecutor(
+                    max_workers=workers, initializer=_worker_init,
+                    initargs=(block.name, layout, wanted)) as executor:
+                # several sources per task, to reduce the overhead
+                chunksize = max(1, len(source_ids) // (4 * workers))
+                distances = list(executor.map(
+                    _worker_distances, source_ids, chunksize=chunksize))
+        finally:
+            block.close()
+            block.unlink()
+
+    by_source = dict(zip(source_ids, distances))
+    return [
+        [by_source[ids[s]].get(ids.get(t)) if s in ids else None
+         for t in targets]
+        for s in sources
+    ]
+
+
+#
+# caching
+#
+
+# a service that gets the same queries over and over again
+# can keep the search trees from the last sources in a cache;
+# like with functools.lru_cache, the least recently used
+# tree is evicted when the cache is full
+from collections import OrderedDict, namedtuple
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+class ShortestPathCache:
+    """
+    answers shortest path queries on a graph, and remembers
+    the whole search tree of the most recently used sources
+
+    the graph must be a dict of dicts, that is then to be modified
+    only through add_edge, remove_edge and set_weight, so that
+    the cache never returns stale results
+    """
+
+    def __init__(self, graph, maxsize=128):
+        self.graph = graph
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # source -> ShortestPathTree
+        self._trees = OrderedDict()
+
+    def _tree(self, v1):
+        tree = self._trees.get(v1)
+        if tree is not None:
+            self.hits += 1
+            self._trees.move_to_end(v1)
+            return tree
+        self.misses += 1
+        tree = shortest_tree(self.graph, v1)
+        self._trees[v1] = tree
+        if len(self._trees) > self.maxsize:
+            self._trees.popitem(last=False)
+        return tree
+
+    def shortest_path(self, v1, v2):
+        """
+        same as shortest_path_heap
+        """
+        tree = self._tree(v1)
+        if v2 not in tree:
+            return None
+        return tree.distance(v2), tree.path_to(v2)
+
+    def shortest_distance(self, v1, v2):
+        """
+        the distance only, or None if v2 cannot be reached
+        """
+        return self._tree(v1).distance(v2)
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses,
+                         self.maxsize, len(self._trees))
+
+    def cache_clear(self):
+        self._trees.clear()
+
+    # mutations
+    def _invalidate(self, s):
+        # a change on an edge leaving s can only matter
+        # for the sources from which s is reachable
+        for v1 in [v1 for v1, tree in self._trees.items() if s in tree]:
+            del self._trees[v1]
+
+    def add_edge(self, s, d, w):
+        """
+        add an edge, or change its weight if it already exists
+        """
+        self.graph.setdefault(s, {})[d] = w
+        self._invalidate(s)
+
+    def set_weight(self, s, d, w):
+        """
+        change the weight of an existing edge
+        """
+        if d not in self.graph.get(s, {}):
+            raise KeyError((s, d))
+        self.add_edge(s, d, w)
+
+    def remove_edge(self, s, d):
+        del self.graph[s][d]
+        self._invalidate(s)
+
+
+#
+# dynamic updates
+#
+
+# when only a few edges change, most of the shortest path tree
+# remains valid, and it is much cheaper to repair it than to redo
+# the whole search; the approach is the one of Ramalingam and Reps:
+# * when an edge gets longer or is removed, only the vertices below it
+#   in the tree are affected; we forget them, and then give each one
+#   the best distance it can get from its unaffected predecessors
+# * when an edge gets shorter or is added, its destination may improve
+# * from there, a regular Dijkstra search propagates the changes,
+#   and stops by itself where distances do not change anymore
+
+class DynamicShortestPaths(ShortestPathTree):
+    """
+    the shortest paths from one source, kept up to date
+    while the edges of the graph change
+
+    the graph must be a dict of dicts, like the ones built by
+    parse_graph2; it is modified in place by the update methods
+
+    Notes:
+      after updates, vertices() is no longer sorted by distance
+    """
+
+    def __init__(self, graph, source):
+        self.graph = graph
+        super().__init__(source, _dijkstra(graph, source))
+        # the incoming edges, needed to repair affected vertices
+        self.reverse = defaultdict(dict, reverse_graph(graph))
+        # the tree downwards, needed to find the affected vertices
+        self.children = defaultdict(set)
+        for vertex, (_, previous) in self.visited.items():
+            if vertex != source:
+                self.children[previous].add(vertex)
+
+    def set_weight(self, s, d, w):
+        """
+        add the s -> d edge, or change its weight
+        """
+        self.update([(s, d, w)])
+
+    def remove_edge(self, s, d):
+        self.update([(s, d, None)])
+
+    def update(self, changes):
+        """
+        apply a batch of changes, and repair the tree once
+
+        Parameters:
+          changes: an iterable of tuples (s, d, w); the s -> d edge
+            is added or gets weight w, or is removed if w is None
+        Raises:
+          KeyError: if an edge to remove does not exist, in which
+            case nothing is changed
+        """
+        # check the whole batch before touching the graph,
+        # so that a bad change does not leave the tree half repaired
+        changes = list(changes)
+        exists = {}
+        for s, d, w in changes:
+            present = exists.get((s, d), d in self.graph.get(s, {}))
+            if w is None and not present:
+                raise KeyError((s, d))
+            exists[(s, d)] = w is not None
+
+        visited, children = self.visited, self.children
+        # the roots of the subtrees to forget
+        longer = []
+        # the edges that may offer better distances
+        shorter = []
+        for s, d, w in changes:
+            old = self.graph.get(s, {}).get(d)
+            if w is None:
+                del self.graph[s][d]
+                del self.reverse[d][s]
+            else:
+                self.graph.setdefault(s, {})[d] = w
+                self.reverse[d][s] = w
+            if old is not None and (w is None or w > old):
+                # only matters if the edge is in the tree
+                if d in visited and d != self.source and visited[d][1] == s:
+                    longer.append(d)
+            elif w is not None and (old is None or w < old):
+                shorter.append((s, d, w))
+
+        # forget the affected subtrees
+        affected = set()
+        stack = longer
+        while stack:
+            vertex = stack.pop()
+            if vertex in affected:
+                continue
+            affected.add(vertex)
+            stack.extend(children.pop(vertex, ()))
+        for vertex in affected:
+            _, previous = visited.pop(vertex)
+            children[previous].discard(vertex)
+
+        # the candidates for the search
+        tie = itertools.count()
+        border = []
+        for vertex in affected:
+            for s, w in self.reverse[vertex].items():
+                if s in visited:
+                    border.append((visited[s][0] + w, next(tie), vertex, s))
+        for s, d, _ in shorter:
+            # use the current weight, in case the edge changed again
+            w = self.graph.get(s, {}).get(d)
+            if s in visited and w is not None:
+                border.append((visited[s][0] + w, next(tie), d, s))
+        heapq.heapify(border)
+
+        # propagate
+        while border:
+            distance, _, vertex, previous = heapq.heappop(border)
+            if distance >= visited.get(vertex, (math.inf,))[0]:
+                continue
+            if vertex in visited:
+                children[visited[vertex][1]].discard(vertex)
+            visited[vertex] = (distance, previous)
+            children[previous].add(vertex)
+            for dest, w in self.graph.get(vertex, {}).items():
+                dist = distance + w
+                if dist < visited.get(dest, (math.inf,))[0]:
+                    heapq.heappush(border, (dist, next(tie), dest, vertex))
+
+
 #
 # utility
 #
@@ -322,6 +1502,114 @@ def to_graphviz(graph, engine='dot'):
     except Exception as exc:
         print("oops:", exc)
 
+
+# to_graphviz goes through one Python call per edge, and keeps the whole
+# graph in memory twice; for big graphs it is much better
+# to write the DOT text directly, and to cut the graph down first
+import random
+
+def _dot_id(vertex):
+    # vertices may be any hashable, e.g. tuples in planar1
+    text = str(vertex).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{text}"'
+
+
+def write_dot(graph, output, highlight=None,
+              budget=None, cluster=None, seed=0):
+    """
+    write a graph in the DOT format, as used by graphviz
+
+    the text is written edge by edge, so memory usage does not
+    depend on the graph size - except with cluster, see below
+
+    Parameters:
+      graph: a dict of dicts, or a CSRGraph
+      output: a filename, or a file-like object
+      highlight: a path to draw in red, either as a sequence
+        of vertices or as a (distance, path) tuple with path a list,
+        as returned e.g. by shortest_path2
+      budget: if set, the approximate maximal number of edges
+        to draw; edges are then picked at random, except the ones
+        on the highlighted path, that are always drawn
+      cluster: if set, a function that maps each vertex to a group;
+        each group is then drawn as one node, and all the edges between
+        2 groups as one edge, labelled with the number of edges
+        and the smallest weight; memory usage is then proportional
+        to the number of pairs of groups
+      seed: the random seed used with budget
+    """
+    if isinstance(output, str):
+        with open(output, 'w') as writer:
+            return write_dot(graph, writer, highlight, budget, cluster, seed)
+
+    # vertices may be tuples themselves, so a tuple is taken as
+    # a (distance, path) pair only if its second item is a list -
+    # or None, that the shortest_path functions return for no path
+    if (isinstance(highlight, tuple) and len(highlight) == 2
+            and (highlight[1] is None or isinstance(highlight[1], list))):
+        _, highlight = highlight
+    path = list(highlight or [])
+    if cluster is not None:
+        path = [cluster(v) for v in path]
+    path_vertices = set(path)
+    path_edges = set(zip(path, path[1:]))
+
+    output.write("digraph {\n")
+    for vertex in path_vertices:
+        output.write(f"  {_dot_id(vertex)} [color=red]\n")
+
+    def write_edge(s, d, label):
+        style = " color=red penwidth=2" if (s, d) in path_edges else ""
+        output.write(f"  {_dot_id(s)} -> {_dot_id(d)}"
+                     f" [label=\"{label}\"{style}]\n")
+
+    if cluster is not None:
+        # (group, group) -> (number of edges, smallest weight)
+        merged = {}
+        for s, adj in graph.items():
+            group = cluster(s)
+            for d, w in adj.items():
+                key = (group, cluster(d))
+                if key[0] == key[1]:
+                    continue
+                count, smallest = merged.get(key, (0, w))
+                merged[key] = (count + 1, min(smallest, w))
+        edges = ((s, d, f"{count}/{w}")
+                 for (s, d), (count, w) in merged.items())
+    else:
+        edges = ((s, d, w)
+                 for s, adj in graph.items() for d, w in adj.items())
+
+    if budget is None:
+        for s, d, label in edges:
+            write_edge(s, d, label)
+    else:
+        # a first pass to count the edges, so we can keep each one
+        # with the same probability, without storing them
+        if cluster is not None:
+            total = len(merged)
+        else:
+            total = sum(len(adj) for adj in graph.values())
+        # the edges on the path count in the budget
+        ratio = max(0, budget - len(path_edges)) / total if total else 1
+        generator = random.Random(seed)
+        for s, d, label in edges:
+            if (s, d) in path_edges or generator.random() < ratio:
+                write_edge(s, d, label)
+    output.write("}\n")
+
+
+def to_graphviz2(graph, engine='dot', **kwargs):
+    """
+    same as to_graphviz, but built from the DOT text
+    written by write_dot, whose options are supported as well
+    """
+    import io
+    import graphviz
+    buffer = io.StringIO()
+    write_dot(graph, buffer, **kwargs)
+    return graphviz.Source(buffer.getvalue(), engine=engine)
+
 ###
 def planar1(n):
     G = {}
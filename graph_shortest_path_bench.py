@@ -0,0 +1,224 @@
+"""
+benchmarks for graph_shortest_path
+
+builds graphs of several families at growing sizes, and times
+the parsers, the reachability and the shortest path functions;
+results are written in a JSON file, see benchmark.py
+
+run e.g.
+    python graph_shortest_path_bench.py --sizes 1000,10000
+"""
+
+import os
+import random
+import tempfile
+from argparse import ArgumentParser
+
+from benchmark import measure, save_results, compare_results
+from graph_shortest_path import (
+    parse_graph1, parse_graph2, parse_graph3, load_graph, CSRGraph,
+    reachables1, reachables2,
+    shortest_distance1, shortest_path1, shortest_path2,
+    shortest_path_heap, shortest_path_bidirectional, shortest_path_astar,
+    reverse_graph, planar1, shortest_tree, DynamicShortestPaths,
+)
+
+
+#
+# graph families
+#
+
+# each builder takes a size, that is the approximate number of edges,
+# and returns a graph as a dict of dicts, and a (source, target) pair
+# for the shortest path queries
+
+def planar(size):
+    # planar1(n) has about 2*n*n edges
+    n = max(2, int((size / 2) ** 0.5))
+    return planar1(n), ((1, 1), (n, n))
+
+
+def sparse(size, degree=4, seed=0):
+    # a random graph where each vertex has <degree> successors
+    generator = random.Random(seed)
+    n = max(2, size // degree)
+    graph = {
+        v: {generator.randrange(n): generator.randint(1, 10)
+            for _ in range(degree)}
+        for v in range(n)
+    }
+    return graph, (0, n-1)
+
+
+def chain(size):
+    graph = {v: {v+1: 1} for v in range(size)}
+    return graph, (0, size)
+
+
+def clique(size, seed=0):
+    # a complete graph has n*(n-1) edges
+    generator = random.Random(seed)
+    n = max(2, int(size ** 0.5))
+    graph = {
+        s: {d: generator.randint(1, 10) for d in range(n) if d != s}
+        for s in range(n)
+    }
+    return graph, (0, n-1)
+
+
+FAMILIES = {
+    'planar': planar,
+    'sparse': sparse,
+    'chain': chain,
+    'clique': clique,
+}
+
+
+def write_graph(graph, filename):
+    """
+    store a graph in the format expected by the parsers
+    """
+    with open(filename, 'w') as writer:
+        for s, adj in graph.items():
+            for d, w in adj.items():
+                # tuples are turned into names like 1-2
+                s_name = '-'.join(map(str, s)) if isinstance(s, tuple) else s
+                d_name = '-'.join(map(str, d)) if isinstance(d, tuple) else d
+                print(f"{s_name}, {d_name}, {w}", file=writer)
+
+
+#
+# what to measure
+#
+
+def parsers(filename):
+    """
+    the parsing functions, as (name, function) pairs
+    """
+    def load_graph_cold():
+        if os.path.exists(filename + '.csr'):
+            os.remove(filename + '.csr')
+        return load_graph(filename)
+    def load_graph_warm():
+        return load_graph(filename)
+    return [
+        ('parse_graph1', lambda: parse_graph1(filename)),
+        ('parse_graph2', lambda: parse_graph2(filename)),
+        ('CSRGraph.from_file', lambda: CSRGraph.from_file(filename)),
+        ('parse_graph3', lambda: parse_graph3(filename)),
+        ('load_graph_cold', load_graph_cold),
+        ('load_graph_warm', load_graph_warm),
+    ]
+
+
+def searches(family, graph, v1, v2):
+    """
+    the searches, as (name, function, slow) triples
+    where slow means at least quadratic in the graph size
+    """
+    reverse = reverse_graph(graph)
+    functions = [
+        ('reachables1', lambda: reachables1(graph, v1), True),
+        ('reachables2', lambda: reachables2(graph, v1), False),
+        ('shortest_distance1',
+         lambda: shortest_distance1(graph, v1, v2), True),
+        ('shortest_path1', lambda: shortest_path1(graph, v1, v2), True),
+        ('shortest_path2', lambda: shortest_path2(graph, v1, v2), True),
+        ('shortest_path_heap',
+         lambda: shortest_path_heap(graph, v1, v2), False),
+        ('shortest_path_bidirectional',
+         lambda: shortest_path_bidirectional(graph, v1, v2, reverse), False),
+    ]
+    # the Manhattan heuristic only makes sense on the grid
+    if family == 'planar':
+        functions.append(
+            ('shortest_path_astar',
+             lambda: shortest_path_astar(graph, v1, v2), False))
+    return functions
+
+
+def run(families, sizes, slow_limit, repeat):
+    records = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for family in families:
+            for size in sizes:
+                graph, (v1, v2) = FAMILIES[family](size)
+                nb_edges = sum(len(adj) for adj in graph.values())
+                common = dict(family=family, size=size)
+                filename = os.path.join(tmpdir, f"{family}-{size}.csv")
+                write_graph(graph, filename)
+                operations = [(name, function, False)
+                              for name, function in parsers(filename)]
+                operations += searches(family, graph, v1, v2)
+                for name, function, slow in operations:
+                    if slow and nb_edges > slow_limit:
+                        continue
+                    measures, _ = measure(function, repeat=repeat)
+                    record = dict(common, operation=name, **measures)
+                    print(f"{family:8} {size:>9} {name:30} "
+                          f"{measures['seconds']:10.4f}s "
+                          f"{measures['peak_bytes']:>12}B")
+                    records.append(record)
+    return records
+
+
+def run_dynamic(sizes, batch, repeat):
+    """
+    compare the cost of repairing a shortest path tree after
+    a batch of weight changes, with the cost of a full search
+    """
+    records = []
+    for size in sizes:
+        graph, (v1, _) = planar(size)
+        edges = [(s, d) for s, adj in graph.items() for d in adj]
+        generator = random.Random(size)
+        dynamic = DynamicShortestPaths(graph, v1)
+        # each call applies a new batch, half increases, half decreases
+        def changes():
+            for s, d in generator.sample(edges, batch):
+                w = graph[s][d]
+                yield s, d, generator.choice((max(1, w // 2), w * 2))
+        common = dict(family='planar', size=size, batch=batch)
+        operations = [
+            ('DynamicShortestPaths.update',
+             lambda: dynamic.update(changes())),
+            ('shortest_tree', lambda: shortest_tree(graph, v1)),
+        ]
+        for name, function in operations:
+            measures, _ = measure(function, repeat=repeat)
+            records.append(dict(common, operation=name, **measures))
+            print(f"planar   {size:>9} {name:30} "
+                  f"{measures['seconds']:10.4f}s "
+                  f"{measures['peak_bytes']:>12}B")
+    return records
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--families", default=','.join(FAMILIES),
+                        help="comma-separated graph families")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated approximate numbers of edges")
+    parser.add_argument("--slow-limit", default=10_000, type=int,
+                        help="skip quadratic functions above that many edges")
+    parser.add_argument("--repeat", default=3, type=int)
+    parser.add_argument("--dynamic-batch", default=0, type=int,
+                        help="if set, also time the repair of a shortest path"
+                             " tree after that many weight changes")
+    parser.add_argument("--output", default="graph_shortest_path_bench.json")
+    parser.add_argument("--compare", default=None,
+                        help="a previous output to compare with")
+    args = parser.parse_args()
+
+    families = args.families.split(',')
+    sizes = [int(size) for size in args.sizes.split(',')]
+    records = run(families, sizes, args.slow_limit, args.repeat)
+    if args.dynamic_batch:
+        records += run_dynamic(sizes, args.dynamic_batch, args.repeat)
+    save_results(args.output, 'graph_shortest_path', records)
+    if args.compare:
+        compare_results(args.compare, records)
+
+
+if __name__ == '__main__':
+    main()
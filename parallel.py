@@ -0,0 +1,38 @@
+"""
+a helper to stream results from a pool of processes,
+shared by the modules that split their work into tasks
+
+executor.map() submits all the tasks upfront, which is not an option
+when there are many of them, or when the consumer may stop early;
+instead only a few tasks are kept running ahead of the consumer
+"""
+
+from collections import deque
+from itertools import islice
+
+
+def bounded_map(submit, tasks, ahead):
+    """
+    the results of the tasks, in order,
+    each one as soon as it is available
+
+    Parameters:
+      submit: a function that takes a task, submits it to an executor,
+        and returns the corresponding future
+      tasks: an iterable of tasks, consumed lazily
+      ahead: the number of tasks running ahead of the consumer,
+        typically twice the number of workers
+    """
+    tasks = iter(tasks)
+    pending = deque(submit(task) for task in islice(tasks, ahead))
+    try:
+        while pending:
+            result = pending.popleft().result()
+            # keep the pool busy while the consumer deals with this result
+            for task in islice(tasks, 1):
+                pending.append(submit(task))
+            yield result
+    finally:
+        # if the consumer stops early
+        for future in pending:
+            future.cancel()
@@ -15,7 +15,7 @@ filled with 0, and one 1 per line - and per column
 
 # the rooks problem is strictly equivalent
 # to iterating over Sn, the permutations of [1..n]
-def rooks(n):
+def rooks_recursive(n):
     """
     generator over the solutions to the rooks problem
     in dimension n
@@ -30,7 +30,7 @@ def rooks(n):
         # (we could also have added a else: clause)
         return
 
-    for smaller in rooks(n-1):
+    for smaller in rooks_recursive(n-1):
         # assume e.g. n=4
         # we iterate over S3 and for each permutation in S3
         # e.g. smaller=[0, 2, 1]
@@ -46,6 +46,50 @@ def rooks(n):
             yield smaller[i:] + [n-1] + smaller[:i]
 
 
+# rooks_recursive() goes n levels deep, and builds a new list
+# for each of the n! permutations; Heap's algorithm instead
+# goes from one permutation to the next with a single swap,
+# so it can work on one list all along
+#
+# c plays the role of the stack of the recursive version:
+# c[i] counts how many times the (i+1) first items have already
+# been swapped at level i, and going back to i=1 after each swap
+# amounts to recursing into the levels below
+
+def heap_permutations(n, copy=False):
+    """
+    generator over the permutations of range(n), using Heap's algorithm
+
+    Parameters:
+      copy: by default the same list is yielded over and over,
+        and gets modified in place when the generator resumes;
+        so it must not be modified, and must be copied if it needs
+        to be kept - or set copy to get a new list each time
+    """
+    a = list(range(n))
+    yield list(a) if copy else a
+    c = [0] * n
+    i = 1
+    while i < n:
+        if c[i] < i:
+            j = c[i] if i % 2 else 0
+            a[j], a[i] = a[i], a[j]
+            yield list(a) if copy else a
+            c[i] += 1
+            i = 1
+        else:
+            c[i] = 0
+            i += 1
+
+
+def rooks(n):
+    """
+    generator over the solutions to the rooks problem
+    in dimension n, as new lists
+    """
+    return heap_permutations(n, copy=True)
+
+
 # moving to the queens problem
 
 # check whether a permutation is valid
@@ -78,7 +122,197 @@ def queens(n):
     # a good example of a closure
     # filter requires a one-argument function
     # so we capture n in a closure, hence the lambda
-    return filter(lambda L: queens_ok(L, n), rooks(n))
+    # and as the permutations all share the same list,
+    # only the ones that make it through the filter get copied
+    return map(list, filter(lambda L: queens_ok(L, n), heap_permutations(n)))
+
+
+
+# queens() scans all the n! permutations, which is hopeless beyond n=11
+# a backtracking search instead places queens one line at a time, and
+# gives up on a partial position as soon as it has no free square left
+#
+# the squares that are taken can be described with 3 integers used
+# as bit masks - a.k.a. bitboards - where bit y is set when
+# * cols: column y is taken
+# * left: column y is on a taken x+y diagonal in the current line
+# * right: column y is on a taken x-y diagonal in the current line
+# and when moving to the next line, left is shifted by one bit
+# to the left, and right by one bit to the right
+
+def queens_bitboard(n):
+    """
+    generator over the solutions to the queens problem
+    in dimension n, using backtracking
+
+    yields the same lists as queens(n), in lexicographic order
+    """
+    return _backtrack(n, (1 << n) - 1)
+
+
+def _masks(n, prefix):
+    """
+    the 3 masks once the queens in prefix are on the first lines
+    """
+    full = (1 << n) - 1
+    cols = left = right = 0
+    for y in prefix:
+        bit = 1 << y
+        cols, left, right = (
+            cols | bit, (left | bit) << 1 & full, (right | bit) >> 1)
+    return cols, left, right
+
+
+def _backtrack(n, first, prefix=()):
+    """
+    the backtracking search itself, that completes a position
+    whose first lines are given by prefix, and where the next queen
+    can only go in the columns whose bit is set in first
+    """
+    full = (1 << n) - 1
+    start = len(prefix)
+    if start == n:
+        yield list(prefix)
+        return
+    position = list(prefix) + [0] * (n - start)
+    # the masks for each line, and the columns left to try there
+    cols, left, right = [0] * n, [0] * n, [0] * n
+    cols[start], left[start], right[start] = _masks(n, prefix)
+    free = [0] * n
+    free[start] = first & ~(cols[start] | left[start] | right[start])
+    x = start
+    while x >= start:
+        bits = free[x]
+        # nothing left to try on this line: backtrack
+        if not bits:
+            x -= 1
+            continue
+        # the lowest bit that is set
+        bit = bits & -bits
+        free[x] = bits ^ bit
+        position[x] = bit.bit_length() - 1
+        if x == n - 1:
+            # a copy, as we keep on working on position
+            yield position[:]
+            continue
+        cols[x+1] = cols[x] | bit
+        left[x+1] = (left[x] | bit) << 1 & full
+        right[x+1] = (right[x] | bit) >> 1
+        free[x+1] = full & ~(cols[x+1] | left[x+1] | right[x+1])
+        x += 1
+
+
+def _count_completions(n, x, cols, left, right):
+    """
+    the number of ways to complete a position where
+    lines 0..x-1 are taken, as described by the 3 masks
+    """
+    if x == n:
+        return 1
+    full = (1 << n) - 1
+    count = 0
+    stack = [(x, cols, left, right)]
+    while stack:
+        x, cols, left, right = stack.pop()
+        free = full & ~(cols | left | right)
+        # on the last line, no need to go further
+        if x == n - 1:
+            count += bin(free).count('1')
+            continue
+        while free:
+            bit = free & -free
+            free ^= bit
+            stack.append((x + 1, cols | bit,
+                          (left | bit) << 1 & full, (right | bit) >> 1))
+    return count
+
+
+def count_queens(n, workers=1):
+    """
+    the number of solutions to the queens problem in dimension n
+
+    by symmetry, a solution with its first queen in column y
+    gives one with its first queen in column n-1-y, so
+    we only need to search with the first queen in the left half
+
+    Parameters:
+      workers: if more than 1, the search is split by the placements
+        of the first 2 queens, and run on a pool of that many processes
+    """
+    # like the generators, count the empty board as one solution
+    if n == 0:
+        return 1
+    if workers > 1 and n >= 4:
+        return _count_queens_parallel(n, workers)
+    full = (1 << n) - 1
+    def first_line(y):
+        bit = 1 << y
+        return _count_completions(n, 1, bit, bit << 1 & full, bit >> 1)
+    total = 2 * sum(first_line(y) for y in range(n // 2))
+    if n % 2:
+        total += first_line(n // 2)
+    return total
+
+
+# beyond n=16 or so, we need several cores; the search tree is easy
+# to split, each subtree being defined by the first queens placed
+import itertools
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from parallel import bounded_map
+
+def _prefixes(n, depth):
+    """
+    the valid placements of depth queens on the first lines,
+    in lexicographic order
+    """
+    for prefix in itertools.permutations(range(n), depth):
+        if queens_ok(prefix, depth):
+            yield prefix
+
+
+def _count_task(n, prefix):
+    return _count_completions(n, len(prefix), *_masks(n, prefix))
+
+
+def _solve_task(n, prefix):
+    return list(_backtrack(n, (1 << n) - 1, prefix))
+
+
+def _count_queens_parallel(n, workers):
+    # same symmetry as in count_queens
+    prefixes, weights = [], []
+    for prefix in _prefixes(n, 2):
+        y = prefix[0]
+        if 2 * y + 1 < n:
+            prefixes.append(prefix)
+            weights.append(2)
+        elif 2 * y + 1 == n:
+            prefixes.append(prefix)
+            weights.append(1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        counts = executor.map(_count_task, itertools.repeat(n), prefixes)
+        return sum(weight * count for weight, count in zip(weights, counts))
+
+
+def iter_queens(n, workers=1):
+    """
+    same as queens_bitboard(n), in the same order
+
+    Parameters:
+      workers: if more than 1, the search is split by the placements
+        of the first 2 queens, and run on a pool of that many processes;
+        solutions are yielded as soon as they are available, and only
+        a few subtrees are searched ahead of the consumer
+    """
+    if workers <= 1 or n < 4:
+        yield from queens_bitboard(n)
+        return
+    tasks = _prefixes(n, 2)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        submit = partial(executor.submit, _solve_task, n)
+        for solutions in bounded_map(submit, tasks, 2 * workers):
+            yield from solutions
 
 
 
@@ -139,17 +373,46 @@ def draw_position(p, filename=None):
 
 
 
+# the geometric transformations can be done on the numpy arrays,
+# but building a n*n array to move n queens is a waste; on a position
+# that is a permutation, they boil down to moving the Ys around:
+# * transposing - i.e. swapping X and Y - gives the inverse permutation
+# * a quarter turn sends the queen in (x, y) to (n-1-y, x)
+
+def transpose(p):
+    """
+    position p after swapping X and Y,
+    same as a.T on the position_to_np() array
+    """
+    result = [0] * len(p)
+    for x, y in enumerate(p):
+        result[y] = x
+    return tuple(result)
+
+
+def rotate(p):
+    """
+    position p after a quarter turn,
+    same as np.rot90() on the position_to_np() array
+    """
+    n = len(p)
+    result = [0] * n
+    for x, y in enumerate(p):
+        result[n-1-y] = x
+    return tuple(result)
+
+
 def derived(p):
     """
     enumerates all 8 variants of p after being rotated / symetric
 
     input p expected to be a position
     """
-    a = position_to_np(p)
+    t = tuple(p)
     for _ in range(4):
-        yield np_to_position(a)
-        yield np_to_position(a.T)
-        a = np.rot90(a)
+        yield t
+        yield transpose(t)
+        t = rotate(t)
 
 
 def uniques(gen):
@@ -172,3 +435,145 @@ def uniques(gen):
         # remember all devived positions in known
         known.update(derived(t))
         yield t
+
+
+# the same transformations on a whole (k, n) array of positions,
+# one per line; with rows = [[0], [1], ... [k-1]], the fancy indexing
+# result[rows, block] = range(n) does result[i, block[i, x]] = x
+# for all lines i at once
+
+def transpose_array(block):
+    """
+    transpose() applied on each line of a (k, n) array of positions
+    """
+    k, n = block.shape
+    result = np.empty_like(block)
+    result[np.arange(k)[:, None], block] = np.arange(n)
+    return result
+
+
+def rotate_array(block):
+    """
+    rotate() applied on each line of a (k, n) array of positions
+    """
+    k, n = block.shape
+    result = np.empty_like(block)
+    result[np.arange(k)[:, None], n-1-block] = np.arange(n)
+    return result
+
+
+def derived_array(block):
+    """
+    derived() applied on each line of a (k, n) array of positions
+
+    Returns:
+      a (8, k, n) array, where result[:, i] are the 8 variants
+      of block[i], in the same order as derived()
+    """
+    variants = []
+    for _ in range(4):
+        variants.append(block)
+        variants.append(transpose_array(block))
+        block = rotate_array(block)
+    return np.stack(variants)
+
+
+# filling a numpy array one permutation at a time would cost
+# as much as the python loop we want to get rid of; instead
+# we compute once the m! permutations of range(m), and each block
+# is made of one arrangement of n-m values in the first columns,
+# and the m! permutations of the m remaining values in the other ones
+
+def permutation_blocks(n, size=4096, out=None):
+    """
+    generator over the permutations of range(n), by blocks
+
+    Parameters:
+      size: the maximal number of lines in a block; blocks have
+        m! lines, with m as large as possible
+      out: an optional preallocated array with at least m! lines
+        and n columns, where to write the blocks
+    Returns:
+      (m!, n) arrays that are all views on the same buffer,
+      so a block gets overwritten when the generator resumes
+    """
+    m, rows = 0, 1
+    while m < n and rows * (m+1) <= size:
+        m += 1
+        rows *= m
+    if out is None:
+        out = np.empty((rows, n), dtype=np.intp)
+    block = out[:rows]
+    # reshape is needed when m is 0
+    tails = np.array(list(rooks(m)), dtype=np.intp).reshape(rows, m)
+    for head in itertools.permutations(range(n), n-m):
+        rest = np.array(sorted(set(range(n)) - set(head)), dtype=np.intp)
+        block[:, :n-m] = head
+        block[:, n-m:] = rest[tails]
+        yield block
+
+
+# queens_ok() on a whole block: in each line, the x+y (resp. x-y)
+# must be all different, i.e. once sorted, no 2 neighbours are equal
+
+def queens_ok_batch(block):
+    """
+    queens_ok() applied on each line of a (k, n) array of positions
+
+    Returns:
+      a boolean array of size k
+    """
+    k, n = block.shape
+    xs = np.arange(n)
+    ok = np.ones(k, dtype=bool)
+    for diagonals in (xs + block, xs - block):
+        diagonals.sort(axis=1)
+        ok &= (np.diff(diagonals, axis=1) != 0).all(axis=1)
+    return ok
+
+
+def queens_batched(n, size=4096):
+    """
+    generator over the solutions to the queens problem
+    in dimension n, same as queens() but checking the permutations
+    by blocks of at most size
+    """
+    for block in permutation_blocks(n, size):
+        for position in block[queens_ok_batch(block)]:
+            yield position.tolist()
+
+
+# uniques() needs to remember all the classes found so far; instead
+# we can decide, from a solution alone, whether it is the one
+# that represents its class - say the smallest in lexicographic order
+
+def canonical(p):
+    """
+    the smallest, in lexicographic order,
+    among the 8 variants of position p
+    """
+    return min(derived(p))
+
+
+def unique_queens(n):
+    """
+    generator over the solutions to the queens problem
+    modulo the 8 rotations and symmetries
+
+    yields the same classes as uniques(queens(n)), and nothing
+    needs to be remembered from one solution to the other
+
+    Notes:
+      the positions are not the same as with uniques(queens(n)),
+      which keeps the first one it meets in each class, while
+      here each class is represented by its canonical() form;
+      so it is the sets of canonical forms that are equal, i.e.
+      {canonical(p) for p in uniques(queens(n))} == set(unique_queens(n))
+    """
+    # the canonical form has its first queen in the left half,
+    # or else its mirror along the Y axis would be smaller
+    first = (1 << (n + 1) // 2) - 1
+    for p in _backtrack(n, first):
+        t = tuple(p)
+        if all(t <= v for v in derived(t)):
+            yield t
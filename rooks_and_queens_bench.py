@@ -0,0 +1,81 @@
+"""
+benchmarks for rooks_and_queens
+
+times the solvers for the queens problem at growing sizes,
+and the parallel count with a growing number of workers, together
+with its speedup against one worker; results are written in
+a JSON file, see benchmark.py
+
+run e.g.
+    python rooks_and_queens_bench.py --sizes 8,10 --workers 1,2,4
+"""
+
+import os
+from argparse import ArgumentParser
+
+from benchmark import measure, save_results, compare_results
+from rooks_and_queens import (
+    queens, queens_batched, queens_bitboard, unique_queens, count_queens,
+    generator_size,
+)
+
+# the solvers, and the largest size they can reasonably deal with
+SOLVERS = [
+    ('queens', lambda n: generator_size(queens(n)), 9),
+    ('queens_batched', lambda n: generator_size(queens_batched(n)), 11),
+    ('queens_bitboard', lambda n: generator_size(queens_bitboard(n)), 13),
+    ('unique_queens', lambda n: generator_size(unique_queens(n)), 13),
+]
+
+
+def run(sizes, workers, repeat):
+    records = []
+    for n in sizes:
+        for name, function, limit in SOLVERS:
+            if n > limit:
+                continue
+            measures, _ = measure(function, n, repeat=repeat)
+            records.append(dict(function=name, n=n, workers=1, **measures))
+            print(f"{name:16} {n:>3} {1:>3} {measures['seconds']:10.4f}s")
+        reference = None
+        for nb in workers:
+            measures, _ = measure(count_queens, n, workers=nb, repeat=repeat)
+            if reference is None:
+                reference = measures['seconds']
+            measures['speedup'] = reference / measures['seconds']
+            records.append(dict(function='count_queens', n=n, workers=nb,
+                                **measures))
+            print(f"{'count_queens':16} {n:>3} {nb:>3} "
+                  f"{measures['seconds']:10.4f}s "
+                  f"x{measures['speedup']:.2f}")
+    return records
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", default="8,10,12",
+                        help="comma-separated board sizes")
+    parser.add_argument("--workers", default=None,
+                        help="comma-separated numbers of processes"
+                             " for count_queens, the first one being"
+                             " the reference for the speedup;"
+                             " default is 1 and the number of cores")
+    parser.add_argument("--repeat", default=3, type=int)
+    parser.add_argument("--output", default="rooks_and_queens_bench.json")
+    parser.add_argument("--compare", default=None,
+                        help="a previous output to compare with")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    if args.workers:
+        workers = [int(nb) for nb in args.workers.split(',')]
+    else:
+        workers = sorted({1, os.cpu_count() or 1})
+    records = run(sizes, workers, args.repeat)
+    save_results(args.output, 'rooks_and_queens', records)
+    if args.compare:
+        compare_results(args.compare, records)
+
+
+if __name__ == '__main__':
+    main()